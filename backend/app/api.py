@@ -1,15 +1,18 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pathlib import Path
-import shutil
-from typing import List
+import hashlib
+import os
+from typing import Dict, List
 import uuid
 from loguru import logger
-import json
+import orjson
 import asyncio
+import aiofiles
+from contextlib import asynccontextmanager
 
-from .main_service import trademark_service
+from .main_service import trademark_service, extract_trademarks_async
 from .models import SearchRequest, SimilarityResponse, UploadResponse
 from .config import settings
 
@@ -17,9 +20,29 @@ from .config import settings
 app = FastAPI(
     title="Trademark Hybrid Search API",
     description="API for trademark similarity search using hybrid approach",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+def _sse(payload: dict) -> bytes:
+    """Encode one server-sent-event frame as bytes via orjson"""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+# Precomputed empty search result: the empty/error paths return this dict
+# directly instead of validating a fresh Pydantic model per request
+_EMPTY_RESPONSE = SimilarityResponse(
+    targetTrademark="",
+    totalCompared=0,
+    similarTrademarksFound=0,
+    results=[]
+).model_dump()
+
+def _empty_search_response(target: str = "") -> ORJSONResponse:
+    """Empty SimilarityResponse payload without model construction"""
+    content = dict(_EMPTY_RESPONSE)
+    content["targetTrademark"] = target
+    return ORJSONResponse(content=content)
+
 # Configure CORS
 allowed_origins = [
     "http://localhost:3000",
@@ -64,6 +87,60 @@ async def health_check():
             detail=f"Service unhealthy: {str(e)}"
         )
 
+# Results of already-processed uploads keyed by content hash, so duplicate
+# PDFs skip re-parsing, re-embedding and Pinecone traffic entirely.
+# Bounded FIFO (dicts keep insertion order) and cleared on every delete,
+# so re-uploading a deleted PDF actually reprocesses it.
+_PROCESSED_CACHE_MAX = 256
+_processed_hashes: Dict[str, UploadResponse] = {}
+
+def _cache_upload_response(content_hash: str, response: UploadResponse) -> None:
+    """Remember a processed upload, dropping the oldest entry when full"""
+    if len(_processed_hashes) >= _PROCESSED_CACHE_MAX:
+        _processed_hashes.pop(next(iter(_processed_hashes)))
+    _processed_hashes[content_hash] = response
+
+def _hash_file(file_path: Path) -> str:
+    """BLAKE2b content hash of a file on disk (chunked)"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def _save_upload_file(file: UploadFile, file_path: Path) -> str:
+    """Persist an UploadFile to disk without blocking the event loop.
+
+    Returns the BLAKE2b content hash of the saved bytes."""
+    # Fast path: zero-copy sendfile when the spooled upload rolled to a real file
+    try:
+        src_fd = file.file.fileno()
+    except (AttributeError, OSError, ValueError):
+        src_fd = None
+
+    if src_fd is not None and hasattr(os, "sendfile"):
+        size = os.fstat(src_fd).st_size
+
+        def _sendfile():
+            with open(file_path, "wb") as dst:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+
+        await asyncio.to_thread(_sendfile)
+        return await asyncio.to_thread(_hash_file, file_path)
+
+    # Default path: chunked async copy via aiofiles, hashing as we go
+    hasher = hashlib.blake2b(digest_size=16)
+    async with aiofiles.open(file_path, "wb") as buffer:
+        while chunk := await file.read(1 << 20):
+            hasher.update(chunk)
+            await buffer.write(chunk)
+    return hasher.hexdigest()
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_pdf(file: UploadFile = File(...)):
     """Upload and process PDF file"""
@@ -81,21 +158,33 @@ async def upload_pdf(file: UploadFile = File(...)):
             detail=f"Invalid file type. Allowed: {settings.allowed_extensions}"
         )
     
-    # Generate unique filename
+    # Save under a temporary name first; the final name is the content hash
     unique_filename = f"{uuid.uuid4()}_{file.filename}"
     file_path = Path(settings.upload_dir) / unique_filename
-    
+
     try:
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        # Save uploaded file without blocking the event loop
+        content_hash = await _save_upload_file(file, file_path)
+
+        # Duplicate upload: skip parsing/embeddings and return the cached result
+        cached_response = _processed_hashes.get(content_hash)
+        if cached_response is not None:
+            logger.info(f"Duplicate upload detected ({content_hash}), returning cached result")
+            file_path.unlink(missing_ok=True)
+            return cached_response
+
+        # Content-addressed filename gives dedup on disk as well
+        hashed_path = Path(settings.upload_dir) / f"{content_hash}.pdf"
+        os.replace(file_path, hashed_path)
+        file_path = hashed_path
+
         # Process PDF with timeout handling
         try:
             response = await asyncio.wait_for(
                 trademark_service.process_pdf(file_path, file.filename),
                 timeout=300.0  # 5 minutes timeout
             )
+            _cache_upload_response(content_hash, response)
             return response
         except asyncio.TimeoutError:
             logger.error(f"PDF processing timeout for file: {file.filename}")
@@ -123,39 +212,27 @@ async def upload_pdf(file: UploadFile = File(...)):
 @app.get("/upload/stream")  # Handle GET requests to prevent 405 error
 async def upload_pdf_stream(file: UploadFile = File(...)):
     """Upload and process PDF file with streaming progress updates"""
-    
-    # Read file content first (before streaming)
-    try:
-        if not file.filename:
-            return StreamingResponse(
-                iter([f"data: {json.dumps({'error': 'No file provided'})}\n\n"]),
-                media_type="text/plain"
-            )
-        
-        # Validate file extension
-        file_extension = Path(file.filename).suffix.lower()
-        if file_extension not in settings.allowed_extensions:
-            return StreamingResponse(
-                iter([f"data: {json.dumps({'error': f'Invalid file type. Allowed: {settings.allowed_extensions}'})}\n\n"]),
-                media_type="text/plain"
-            )
-        
-        # Read file content
-        file_content = await file.read()
-        
-    except Exception as e:
+
+    # Validate the upload first (before streaming); the content itself is
+    # streamed to disk chunk by chunk so large PDFs never sit fully in RAM
+    if not file.filename:
         return StreamingResponse(
-            iter([f"data: {json.dumps({'error': f'Error reading file: {str(e)}'})}\n\n"]),
-            media_type="text/plain"
+            iter([_sse({'error': 'No file provided'})]),
+            media_type="text/event-stream"
         )
-    
+
+    # Validate file extension
+    file_extension = Path(file.filename).suffix.lower()
+    if file_extension not in settings.allowed_extensions:
+        return StreamingResponse(
+            iter([_sse({'error': f'Invalid file type. Allowed: {settings.allowed_extensions}'})]),
+            media_type="text/event-stream"
+        )
+
     async def generate_stream():
         file_path = None
         try:
             # Set up connection monitoring
-            import asyncio
-            from contextlib import asynccontextmanager
-            
             @asynccontextmanager
             async def connection_manager():
                 try:
@@ -176,17 +253,17 @@ async def upload_pdf_stream(file: UploadFile = File(...)):
                 file_path = Path(settings.upload_dir) / unique_filename
                 
                 # Step 1: Save file (10%)
-                yield f"data: {json.dumps({'progress': 10, 'status': 'Saving file...'})}\n\n"
+                yield _sse({'progress': 10, 'status': 'Saving file...'})
                 await asyncio.sleep(0.1)  # Small delay to ensure proper streaming
             
             try:
-                # Save the file content we read earlier
-                import aiofiles
+                # Stream the upload straight to disk in 1MB chunks
                 async with aiofiles.open(file_path, 'wb') as buffer:
-                    await buffer.write(file_content)
-                        
+                    while chunk := await file.read(1 << 20):
+                        await buffer.write(chunk)
+
             except Exception as e:
-                yield f"data: {json.dumps({'error': f'Error saving file: {str(e)}'})}\n\n"
+                yield _sse({'error': f'Error saving file: {str(e)}'})
                 return
             
             # Step 2: Process PDF in streaming fashion
@@ -194,36 +271,32 @@ async def upload_pdf_stream(file: UploadFile = File(...)):
                 logger.info(f"Streaming PDF processing: {file.filename}")
                 
                 # Step 2a: Extract text and parse trademarks (30%)
-                yield f"data: {json.dumps({'progress': 30, 'status': 'Extracting text and trademarks...'})}\n\n"
+                yield _sse({'progress': 30, 'status': 'Extracting text and trademarks...'})
                 await asyncio.sleep(0.1)  # Small delay to ensure proper streaming
                 
-                from .pdf_processor import PDFProcessor
-                pdf_processor = PDFProcessor()
-                text, trademarks = pdf_processor.extract_trademarks_list(file_path)
+                # CPU-bound parsing runs in the process pool so the event loop
+                # stays free for concurrent searches and progress frames
+                text, trademarks = await extract_trademarks_async(file_path)
                 
                 if not trademarks:
-                    yield f"data: {json.dumps({'error': 'No trademarks found in PDF'})}\n\n"
+                    yield _sse({'error': 'No trademarks found in PDF'})
                     return
                 
-                yield f"data: {json.dumps({'progress': 50, 'status': 'Found trademarks'})}\n\n"
+                yield _sse({'progress': 50, 'status': 'Found trademarks'})
                 await asyncio.sleep(0.1)  # Small delay to ensure proper streaming
                 
                 # Step 2b: Generate embeddings (70%)
-                yield f"data: {json.dumps({'progress': 70, 'status': 'Generating embeddings...'})}\n\n"
+                yield _sse({'progress': 70, 'status': 'Generating embeddings...'})
                 await asyncio.sleep(0.1)  # Small delay to ensure proper streaming
                 
-                from .embedding_service import EmbeddingService
-                embedding_service = EmbeddingService()
                 trademark_texts = [tm.get_search_text() for tm in trademarks]
-                embeddings = embedding_service.generate_embeddings(trademark_texts)
+                embeddings = await trademark_service.embedding_service.agenerate_embeddings(trademark_texts)
                 
                 # Step 2c: Upsert to Pinecone (90%)
-                yield f"data: {json.dumps({'progress': 90, 'status': 'Storing in database...'})}\n\n"
+                yield _sse({'progress': 90, 'status': 'Storing in database...'})
                 await asyncio.sleep(0.1)  # Small delay to ensure proper streaming
                 
-                from .pinecone_service import PineconeService
-                pinecone_service = PineconeService()
-                upsert_result = pinecone_service.upsert_trademarks(trademarks, embeddings)
+                upsert_result = trademark_service.pinecone_service.upsert_trademarks(zip(trademarks, embeddings))
                 
                 # Step 3: Complete (100%)
                 success_count = upsert_result['total_processed']
@@ -234,7 +307,7 @@ async def upload_pdf_stream(file: UploadFile = File(...)):
                 else:
                     message = 'PDF processed successfully'
                     
-                yield f"data: {json.dumps({'progress': 100, 'status': 'completed', 'message': message, 'details': upsert_result})}\n\n"
+                yield _sse({'progress': 100, 'status': 'completed', 'message': message, 'details': upsert_result})
                 
                 # Clean up file
                 file_path.unlink(missing_ok=True)
@@ -242,15 +315,15 @@ async def upload_pdf_stream(file: UploadFile = File(...)):
             except Exception as e:
                 logger.error(f"Error processing PDF: {str(e)}")
                 file_path.unlink(missing_ok=True)
-                yield f"data: {json.dumps({'error': f'Error processing PDF: {str(e)}'})}\n\n"
+                yield _sse({'error': f'Error processing PDF: {str(e)}'})
                 
         except Exception as e:
             logger.error(f"Streaming error: {str(e)}")
-            yield f"data: {json.dumps({'error': f'Server error: {str(e)}'})}\n\n"
+            yield _sse({'error': f'Server error: {str(e)}'})
     
     return StreamingResponse(
         generate_stream(),
-        media_type="text/plain",
+        media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache, no-store, must-revalidate",
             "Pragma": "no-cache",
@@ -259,7 +332,7 @@ async def upload_pdf_stream(file: UploadFile = File(...)):
             "X-Accel-Buffering": "no",  # Disable Nginx buffering
             "X-Content-Type-Options": "nosniff",  # Prevent MIME type sniffing
             "Transfer-Encoding": "chunked",  # Explicitly set chunked encoding
-            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Type": "text/event-stream; charset=utf-8",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Headers": "*",
             "Access-Control-Allow-Methods": "GET, POST, OPTIONS"
@@ -276,12 +349,7 @@ async def search_trademarks(request: dict):
         
         query = request.get("query", "").strip()
         if not query:
-            return SimilarityResponse(
-                targetTrademark="",
-                totalCompared=0,
-                similarTrademarksFound=0,
-                results=[]
-            )
+            return _empty_search_response()
         
         search_request = SearchRequest(
             trademark=query,
@@ -300,12 +368,7 @@ async def search_trademarks(request: dict):
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
         # Return empty results instead of error for better UX
-        return SimilarityResponse(
-            targetTrademark=request.get("query", ""),
-            totalCompared=0,
-            similarTrademarksFound=0,
-            results=[]
-        )
+        return _empty_search_response(request.get("query", ""))
 
 @app.get("/search")
 async def search_trademarks_get(
@@ -322,12 +385,7 @@ async def search_trademarks_get(
             threshold = settings.similarity_threshold
             
         if not trademark.strip():
-            return SimilarityResponse(
-                targetTrademark="",
-                totalCompared=0,
-                similarTrademarksFound=0,
-                results=[]
-            )
+            return _empty_search_response()
         
         request = SearchRequest(
             trademark=trademark.strip(),
@@ -344,18 +402,19 @@ async def search_trademarks_get(
     except Exception as e:
         logger.error(f"GET search error: {str(e)}")
         # Return empty results instead of error for better UX
-        return SimilarityResponse(
-            targetTrademark=trademark,
-            totalCompared=0,
-            similarTrademarksFound=0,
-            results=[]
-        )
+        return _empty_search_response(trademark)
 
 @app.delete("/document/{document_id}")
 async def delete_document(document_id: str):
     """Delete a document and its vectors"""
     try:
         success = await trademark_service.delete_document(document_id)
+        # One PDF yields one documentId per trademark but the cached response
+        # only records the first, so per-document eviction cannot be keyed
+        # reliably. Deletes are rare: drop the whole cache and let affected
+        # PDFs reprocess on their next upload instead of replaying a stale
+        # success for vectors that are gone.
+        _processed_hashes.clear()
         return {"success": success, "message": f"Document {document_id} deleted"}
         
     except Exception as e:
@@ -25,6 +25,8 @@ class Settings(BaseSettings):
     pinecone_index_name: str = "trademark-search"
     pinecone_environment: str = "us-east-1"
     pinecone_index_host: str = ""
+    pinecone_pool_threads: int = 30  # Thread pool size for parallel upserts
+    pinecone_batch_size: int = 100  # Vectors per upsert request
     
     # Embedding Configuration
     embedding_dimension: int = 1536
@@ -1,16 +1,137 @@
-from typing import List
-from openai import OpenAI
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional
+import httpx
+from openai import OpenAI, AsyncOpenAI
 import numpy as np
+import tiktoken
 from loguru import logger
 from .config import settings
 
+def _build_async_http_client() -> httpx.AsyncClient:
+    """Tuned HTTP/2 transport: keepalive avoids per-request TLS handshakes
+    and HTTP/2 multiplexes concurrent embedding batches over few connections"""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+
+# Single shared transport for all async OpenAI calls made on the service's
+# long-lived event loop. Short-lived asyncio.run loops must NOT use it —
+# keep-alive connections opened there would outlive their loop and poison
+# later calls with "Event loop is closed" (see generate_embeddings).
+_async_http_client = _build_async_http_client()
+
+class _QueryBatcher:
+    """Coalesces concurrent single-query embedding requests into one API call.
+
+    A background task drains the queue every MAX_WAIT seconds (or as soon as
+    MAX_BATCH queries accumulate), embeds the whole batch once, and fans the
+    results back to the awaiting futures. Under bursty load (autocomplete,
+    bulk analysis) N concurrent searches collapse into one OpenAI round trip."""
+
+    MAX_BATCH = 32
+    MAX_WAIT = 0.01  # seconds
+
+    def __init__(self, service: "EmbeddingService"):
+        self._service = service
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    async def submit(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+
+        # Lazily start the drain task once we have a running loop
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block until at least one query arrives
+            batch = [await self._queue.get()]
+
+            # Collect more queries until the batch fills or the window closes
+            deadline = loop.time() + self.MAX_WAIT
+            while len(batch) < self.MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await self._service.agenerate_embeddings(texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
 class EmbeddingService:
+    # Max batches in flight against the OpenAI API at once
+    MAX_CONCURRENT_BATCHES = 8
+    # Token budget per embeddings request (API rejects >8192)
+    MAX_TOKENS_PER_REQUEST = 7500
+    # OpenAI per-request item cap
+    MAX_TEXTS_PER_REQUEST = 2048
+    # In-process cache size for query embeddings
+    QUERY_CACHE_SIZE = 4096
+
     def __init__(self):
         self.client = OpenAI(api_key=settings.openai_api_key)
+        self.aclient = AsyncOpenAI(api_key=settings.openai_api_key,
+                                   http_client=_async_http_client)
         self.model_name = settings.openai_embedding_model
         self.dimension = settings.embedding_dimension
-        
+
+        try:
+            self.encoding = tiktoken.encoding_for_model(self.model_name)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+
+        # LRU cache of query embeddings keyed by normalized query text;
+        # values are tuples so cached entries stay immutable
+        self._query_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._query_batcher = _QueryBatcher(self)
+
         logger.info(f"OpenAI embedding service initialized with model: {self.model_name}")
+
+    @staticmethod
+    def _normalize_query(text: str) -> str:
+        """Normalize a query for cache lookup (case/whitespace insensitive)"""
+        return " ".join(text.lower().split())
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query with an in-process LRU cache.
+
+        Popular search queries skip the OpenAI round trip entirely, leaving
+        Pinecone latency as the only network cost on the hot path."""
+        key = self._normalize_query(text)
+
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return list(cached)
+
+        embedding = await self._query_batcher.submit(text)
+
+        self._query_cache[key] = tuple(embedding)
+        if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+
+        return embedding
     
     def _generate_embeddings_openai(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings using OpenAI API"""
@@ -21,60 +142,140 @@ class EmbeddingService:
             )
             
             embeddings = [data.embedding for data in response.data]
-            logger.info(f"Generated {len(embeddings)} embeddings using OpenAI GPT model: {self.model_name}")
+            # Per-request detail at debug; callers log the aggregate count
+            logger.debug(f"Generated {len(embeddings)} embeddings using OpenAI GPT model: {self.model_name}")
             return embeddings
             
         except Exception as e:
             logger.error(f"Error with OpenAI embeddings: {str(e)}")
             raise
     
-    def _generate_embeddings_batch(self, texts: List[str], batch_size: int = 10) -> List[List[float]]:
-        """Generate embeddings in smaller batches to avoid token limits"""
-        all_embeddings = []
-        total_texts = len(texts)
-        
-        for i in range(0, total_texts, batch_size):
-            batch = texts[i:i + batch_size]
+    def _pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """Greedily pack texts into batches using exact token counts.
+
+        Replaces the chars/4 heuristic: short trademark texts pack into far
+        fewer requests, and long ones can no longer overflow the 8192-token
+        per-request limit."""
+        token_counts = [len(self.encoding.encode(text)) for text in texts]
+
+        batches = []
+        current_batch = []
+        current_tokens = 0
+
+        for text, tokens in zip(texts, token_counts):
+            if current_batch and (
+                current_tokens + tokens > self.MAX_TOKENS_PER_REQUEST
+                or len(current_batch) >= self.MAX_TEXTS_PER_REQUEST
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+
+            current_batch.append(text)
+            current_tokens += tokens
+
+        if current_batch:
+            batches.append(current_batch)
+
+        return batches
+
+    async def _agenerate_embeddings_openai(self, texts: List[str],
+                                           semaphore: asyncio.Semaphore,
+                                           aclient: Optional[AsyncOpenAI] = None) -> List[List[float]]:
+        """Generate embeddings for one batch using the async OpenAI client"""
+        client = self.aclient if aclient is None else aclient
+        async with semaphore:
             try:
-                batch_embeddings = self._generate_embeddings_openai(batch)
-                all_embeddings.extend(batch_embeddings)
-                logger.info(f"Processed embedding batch {i//batch_size + 1}/{(total_texts + batch_size - 1)//batch_size}")
+                response = await client.embeddings.create(
+                    model=self.model_name,
+                    input=texts
+                )
+                return [data.embedding for data in response.data]
+
             except Exception as e:
-                logger.error(f"Error processing batch {i//batch_size + 1}: {str(e)}")
+                logger.error(f"Error with async OpenAI embeddings: {str(e)}")
                 raise
-        
+
+    async def agenerate_embeddings(self, texts: List[str],
+                                   aclient: Optional[AsyncOpenAI] = None) -> List[List[float]]:
+        """Generate embeddings with concurrent batches (async hot path).
+
+        aclient overrides the shared client for callers running in their own
+        short-lived event loop (see generate_embeddings)."""
+        if not texts:
+            return []
+
+        batches = self._pack_batches(texts)
+
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_BATCHES)
+        logger.info(f"Processing {len(texts)} texts in {len(batches)} concurrent token-packed batches")
+
+        batch_results = await asyncio.gather(
+            *[self._agenerate_embeddings_openai(batch, semaphore, aclient)
+              for batch in batches]
+        )
+
+        all_embeddings = []
+        for batch_embeddings in batch_results:
+            all_embeddings.extend(batch_embeddings)
+
+        logger.info(f"Generated {len(all_embeddings)} embeddings using OpenAI GPT model: {self.model_name}")
         return all_embeddings
-    
+
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings using OpenAI GPT model with automatic batching"""
+        """Generate embeddings using OpenAI GPT model with automatic batching (sync wrapper)"""
         if not texts:
             return []
-        
-        # Estimate tokens per text (rough: 1 token ≈ 4 chars)
-        avg_chars_per_text = sum(len(text) for text in texts) // len(texts)
-        estimated_tokens_per_text = avg_chars_per_text // 4
-        
-        # OpenAI limit: ~8192 tokens per request for context
-        max_tokens_per_request = 8000
-        max_texts_per_batch = max(1, max_tokens_per_request // max(estimated_tokens_per_text, 1))
-        
-        # Use smaller batch if texts are large
-        if estimated_tokens_per_text > 500:
-            batch_size = min(5, max_texts_per_batch)
-        else:
-            batch_size = min(20, max_texts_per_batch)
-        
-        if len(texts) <= batch_size:
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop: legacy sync caller, drive the async path in a
+            # private loop. The shared keep-alive transport must not be used
+            # here — connections it opens would stay bound to this loop after
+            # asyncio.run closes it, and the next sync call within the
+            # keep-alive window would fail with "Event loop is closed" — so
+            # the transport lives and dies inside the loop with the call.
+            async def _run_with_own_transport() -> List[List[float]]:
+                async with _build_async_http_client() as http_client:
+                    aclient = AsyncOpenAI(api_key=settings.openai_api_key,
+                                          http_client=http_client)
+                    return await self.agenerate_embeddings(texts, aclient=aclient)
+
+            return asyncio.run(_run_with_own_transport())
+
+        # Called from inside a running loop without await: fall back to serial sync client
+        batches = self._pack_batches(texts)
+        if len(batches) == 1:
             return self._generate_embeddings_openai(texts)
-        else:
-            logger.info(f"Processing {len(texts)} texts in batches of {batch_size}")
-            return self._generate_embeddings_batch(texts, batch_size)
+
+        logger.info(f"Processing {len(texts)} texts in {len(batches)} token-packed batches")
+        all_embeddings = []
+        for i, batch in enumerate(batches):
+            try:
+                all_embeddings.extend(self._generate_embeddings_openai(batch))
+                # Progress every 10th batch; per-batch lines are pure format cost
+                if (i + 1) % 10 == 0 or i + 1 == len(batches):
+                    logger.info(f"Processed embedding batch {i + 1}/{len(batches)}")
+            except Exception as e:
+                logger.error(f"Error processing batch {i + 1}: {str(e)}")
+                raise
+        return all_embeddings
     
-    def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
-        """Calculate cosine similarity between two embeddings"""
-        vec1 = np.array(embedding1)
-        vec2 = np.array(embedding2)
-        
-        # Cosine similarity
-        similarity = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-        return float(similarity)
\ No newline at end of file
+    def calculate_similarity_batch(self, query_embedding, candidate_matrix) -> np.ndarray:
+        """Calculate cosine similarity of one query against N candidates in a single gemv.
+
+        candidate_matrix must be a contiguous (N, dim) float32 array; one BLAS call
+        replaces N Python-level pair computations.
+        """
+        query = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        candidates = np.ascontiguousarray(candidate_matrix, dtype=np.float32)
+
+        query_norm = np.linalg.norm(query)
+        candidate_norms = np.linalg.norm(candidates, axis=1)
+
+        # Avoid division by zero for degenerate vectors
+        denom = candidate_norms * query_norm
+        denom[denom == 0] = 1.0
+
+        return (candidates @ query) / denom
\ No newline at end of file
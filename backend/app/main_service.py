@@ -1,8 +1,13 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List
+from aiolimiter import AsyncLimiter
 from loguru import logger
 
-from .pdf_processor import PDFProcessor
+from .pdf_processor import PDFProcessor, extract_trademarks_worker
 from .text_chunker import TextChunker
 from .embedding_service import EmbeddingService
 from .pinecone_service import PineconeService
@@ -10,7 +15,36 @@ from .similarity_service import SimilarityService
 from .models import UploadResponse, SimilarityResponse, SearchRequest
 from .config import settings
 
+# Pinecone caps upsert bandwidth (~50MB/s); a token bucket just below the
+# ceiling keeps parallel upserts from tripping RESOURCE_EXHAUSTED retries
+_upsert_limiter = AsyncLimiter(45, 1)  # MB per second
+
+# Rough JSON metadata overhead per vector when estimating upsert bytes
+_VECTOR_METADATA_OVERHEAD = 1024
+
+# Process pool for CPU-bound PDF parsing; keeps the event loop responsive
+# and scales extraction across cores (the GIL blocks thread-based parallelism).
+# Spawn context: workers fork lazily on the first upload, by which point this
+# process holds a live gRPC channel and uvloop helper threads — gRPC's C core
+# is not fork-safe, so children start from a clean interpreter instead. The
+# worker lives in pdf_processor so spawned children import only the parser,
+# never this module's service singletons.
+_pdf_pool = ProcessPoolExecutor(
+    max_workers=os.cpu_count(),
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+async def extract_trademarks_async(file_path: Path):
+    """Run PDF extraction in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pdf_pool, extract_trademarks_worker, str(file_path))
+
 class TrademarkService:
+    # Trademarks per fused embed+upsert pipeline batch
+    PIPELINE_BATCH_SIZE = 64
+    # Batches allowed to embed concurrently
+    PIPELINE_CONCURRENCY = 4
+
     def __init__(self):
         self.pdf_processor = PDFProcessor()
         self.text_chunker = TextChunker(
@@ -74,7 +108,7 @@ class TrademarkService:
             
             # Step 1: Extract text and parse individual trademarks (NEW STRATEGY)
             logger.info("Step 1: Extracting trademarks from PDF...")
-            text, trademarks = self.pdf_processor.extract_trademarks_list(file_path)
+            text, trademarks = await extract_trademarks_async(file_path)
             
             if not trademarks:
                 raise ValueError("No trademarks found in PDF")
@@ -86,29 +120,48 @@ class TrademarkService:
                 logger.info(f"Sample trademark IDs: {[tm.trademarkId for tm in trademarks[:5]]}")
                 logger.info(f"Duplicate check - Total: {len(trademarks)}, Unique IDs: {len(set(tm.trademarkId for tm in trademarks))}")
             
-            # Step 2: Generate embeddings untuk setiap merek dengan progress logging
-            logger.info("Step 2: Generating embeddings...")
-            trademark_texts = [tm.get_search_text() for tm in trademarks]
-            
-            # Process embeddings in smaller batches to avoid memory issues
-            embedding_batch_size = 100
-            all_embeddings = []
-            
-            for i in range(0, len(trademark_texts), embedding_batch_size):
-                batch_texts = trademark_texts[i:i + embedding_batch_size]
-                batch_num = i//embedding_batch_size + 1
-                total_embedding_batches = (len(trademark_texts) + embedding_batch_size - 1)//embedding_batch_size
-                
-                logger.info(f"Generating embeddings batch {batch_num}/{total_embedding_batches}: {len(batch_texts)} texts")
-                batch_embeddings = self.embedding_service.generate_embeddings(batch_texts)
-                all_embeddings.extend(batch_embeddings)
-            
-            logger.info(f"Generated {len(all_embeddings)} embeddings successfully")
-            
-            # Step 3: Upsert individual trademarks to Pinecone (NEW STRATEGY) with progress logging
-            logger.info("Step 3: Storing trademarks in Pinecone database...")
-            upsert_result = self.pinecone_service.upsert_trademarks(trademarks, all_embeddings)
-            
+            # Step 2+3 fused: embed each batch and submit its upsert immediately,
+            # so the first vectors reach Pinecone while later batches still embed.
+            # Peak memory is proportional to the in-flight batches, not the corpus.
+            logger.info("Step 2: Embedding and storing trademarks (pipelined)...")
+            batch_size = self.PIPELINE_BATCH_SIZE
+            batches = [trademarks[i:i + batch_size]
+                       for i in range(0, len(trademarks), batch_size)]
+            semaphore = asyncio.Semaphore(self.PIPELINE_CONCURRENCY)
+            pending_upserts = []
+            embedded_count = 0
+
+            async def _process_batch(batch_num: int, batch: List) -> None:
+                nonlocal embedded_count
+                async with semaphore:
+                    batch_texts = [tm.get_search_text() for tm in batch]
+                    # Per-batch progress every 10th batch; the aggregate is
+                    # logged once after the gather
+                    if batch_num % 10 == 0 or batch_num == len(batches):
+                        logger.info(f"Embedding batch {batch_num}/{len(batches)}: {len(batch_texts)} texts")
+                    batch_embeddings = await self.embedding_service.agenerate_embeddings(batch_texts)
+
+                embedded_count += len(batch_embeddings)
+
+                # Throttle to stay under Pinecone's upsert bandwidth ceiling
+                batch_mb = len(batch) * (
+                    settings.embedding_dimension * 4 + _VECTOR_METADATA_OVERHEAD
+                ) / (1024 * 1024)
+                await _upsert_limiter.acquire(min(batch_mb, 45))
+
+                # Fire-and-forget upsert; resolved after all batches are queued
+                pending_upserts.extend(
+                    self.pinecone_service.submit_upsert(batch, batch_embeddings)
+                )
+
+            await asyncio.gather(*[
+                _process_batch(batch_num, batch)
+                for batch_num, batch in enumerate(batches, 1)
+            ])
+            logger.info(f"Generated {embedded_count} embeddings successfully")
+
+            upsert_result = self.pinecone_service.resolve_upserts(pending_upserts)
+
             # Log detailed results
             logger.info(f"Upsert result: {upsert_result['total_processed']} successful, {upsert_result['failed_count']} failed")
             if upsert_result['failed_count'] > 0:
@@ -137,8 +190,8 @@ class TrademarkService:
         try:
             logger.info(f"Searching for similar trademarks: {request.trademark}")
             
-            # Step 1: Generate query embedding
-            query_embedding = self.embedding_service.generate_embeddings([request.trademark])[0]
+            # Step 1: Generate query embedding (cached for repeated queries)
+            query_embedding = await self.embedding_service.aembed_query(request.trademark)
             
             # Step 2: Query Pinecone
             pinecone_results = self.pinecone_service.query_similar_vectors(
@@ -151,7 +204,8 @@ class TrademarkService:
             response = self.similarity_service.process_search_results(
                 request.trademark,
                 pinecone_results,
-                threshold=request.threshold
+                threshold=request.threshold,
+                top_k=request.topK
             )
             
             logger.info(f"Search completed: {response.similarTrademarksFound} similar trademarks found")
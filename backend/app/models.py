@@ -1,7 +1,23 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+def build_search_text(nama_merek: str, nama_pemohon: str,
+                      uraian_barang_jasa: str, kelas_barang_jasa: str) -> str:
+    """Build the embedding text for a trademark from raw field values.
+
+    Free function so hot ingest loops can call it on raw strings without
+    going through model attribute access."""
+    uraian = uraian_barang_jasa
+    if uraian.startswith("Kelas "):
+        uraian = uraian.split(":", 1)[-1].strip()
+
+    return (f"Nama Merek: {nama_merek} | Pemohon: {nama_pemohon} | "
+            f"Barang/Jasa: {uraian} | Kelas: {kelas_barang_jasa}")
+
+def _now_iso() -> str:
+    return datetime.now().isoformat()
+
 class TrademarkMetadata(BaseModel):
     documentId: str
     namaMerek: str
@@ -10,10 +26,16 @@ class TrademarkMetadata(BaseModel):
     namaPemohon: str
     uraianBarangJasa: str
     sourceDocument: str = "pdf"
-    uploadDate: datetime = Field(default_factory=datetime.now)
+    # ISO string instead of datetime: serializes straight to Pinecone metadata
+    # and JSON without an encoder pass; ingest loops pass one shared timestamp
+    uploadDate: str = Field(default_factory=_now_iso)
 
 class IndividualTrademark(BaseModel):
     """Model untuk merek individual (bukan chunk)"""
+    # Frozen: instances are immutable after parse, which skips Pydantic's
+    # mutation bookkeeping on the N-per-PDF hot path
+    model_config = ConfigDict(frozen=True)
+
     trademarkId: str  # Format: documentId_merekIndex
     namaMerek: str
     nomorPermohonan: str
@@ -22,36 +44,36 @@ class IndividualTrademark(BaseModel):
     uraianBarangJasa: str
     documentId: str
     sourceDocument: str = "pdf"
-    uploadDate: datetime = Field(default_factory=datetime.now)
+    uploadDate: str = Field(default_factory=_now_iso)
     
     def get_search_text(self) -> str:
         """Text yang akan di-embedding untuk similarity search"""
         # Strategi baru: representasi komprehensif untuk satu vector per merek
-        parts = []
-        
-        # Nama merek - prioritas utama
-        parts.append(f"Nama Merek: {self.namaMerek}")
-        
-        # Nama pemohon - penting untuk konteks bisnis
-        parts.append(f"Pemohon: {self.namaPemohon}")
-        
-        # Uraian barang/jasa - detail utama
-        uraian = self.uraianBarangJasa
-        if uraian.startswith("Kelas "):
-            uraian = uraian.split(":", 1)[-1].strip()
-        parts.append(f"Barang/Jasa: {uraian}")
-        
-        # Kelas barang/jasa - kategori
-        parts.append(f"Kelas: {self.kelasBarangJasa}")
-        
-        # Gabungkan dengan separator yang jelas
-        return " | ".join(parts)
+        return build_search_text(self.namaMerek, self.namaPemohon,
+                                 self.uraianBarangJasa, self.kelasBarangJasa)
 
 class TextChunk(BaseModel):
-    text: str
+    """Chunk sebagai offset (start, end) ke string sumber.
+
+    Semua chunk berbagi satu referensi `source`; teksnya baru di-slice saat
+    diakses, jadi chunking tidak menyalin ratusan potongan string di muka."""
+    source: str
+    start: int
+    end: int
     chunk_index: int
     metadata: TrademarkMetadata
 
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end].strip()
+
+    @classmethod
+    def from_text(cls, text: str, chunk_index: int,
+                  metadata: TrademarkMetadata) -> "TextChunk":
+        """Bungkus string yang sudah jadi (bukan slice dari dokumen)"""
+        return cls(source=text, start=0, end=len(text),
+                   chunk_index=chunk_index, metadata=metadata)
+
 class SimilarityResult(BaseModel):
     trademark_name: str
     application_number: str
@@ -1,59 +1,139 @@
+import bisect
+import itertools
 import re
-import pdfplumber
-from typing import Dict, List, Optional
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import fitz  # PyMuPDF
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 from loguru import logger
 from .models import TrademarkMetadata, IndividualTrademark
 
+try:
+    import ahocorasick  # pyahocorasick: optional, C-level multi-keyword scan
+except ImportError:  # pragma: no cover - fallback regex path tetap jalan
+    ahocorasick = None
+
+@dataclass(slots=True)
+class _DjkiEntry:
+    """Satu baris tabel DJKI hasil ekstraksi.
+
+    Slots: satu alokasi per entri dengan akses atribut C-level, menggantikan
+    dict 7-key yang di-hash ulang setiap pembacaan field."""
+    no: str
+    nomor: str
+    tanggal: str
+    kelas: str
+    nama_merek: str
+    pemohon: str
+    uraian: str
+
 class PDFProcessor:
     def __init__(self):
+        # Pre-compiled sekali di sini; pattern.search() langsung tanpa
+        # lookup cache re._compile per panggilan
         self.metadata_patterns = {
-            'namaMerek': r'Nama Merek\s*:\s*(.+)',
-            'nomorPermohonan': r'Nomor Permohonan\s*:\s*(.+)',
-            'kelasBarangJasa': r'Kelas\s*:\s*(.+)',
-            'namaPemohon': r'Pemohon\s*:\s*(.+)',
-            'uraianBarangJasa': r'Uraian Barang/Jasa\s*:\s*(.+)'
+            field: re.compile(pattern, re.IGNORECASE)
+            for field, pattern in {
+                'namaMerek': r'Nama Merek\s*:\s*(.+)',
+                'nomorPermohonan': r'Nomor Permohonan\s*:\s*(.+)',
+                'kelasBarangJasa': r'Kelas\s*:\s*(.+)',
+                'namaPemohon': r'Pemohon\s*:\s*(.+)',
+                'uraianBarangJasa': r'Uraian Barang/Jasa\s*:\s*(.+)'
+            }.items()
         }
         
-        # Pattern untuk format tabel DJKI
+        # Pattern untuk format tabel DJKI (named groups untuk akses langsung)
         self.djki_table_pattern = re.compile(
-            r'^\s*(\d+)\s+([A-Z0-9]+)\s+(\d{2}/\d{2}/\d{4})\s+(\d+)\s+(.+?)(?=\n\s*\d+\s+[A-Z0-9]+|$)',
+            r'^\s*(?P<no>\d+)\s+(?P<nomor>[A-Z0-9]+)\s+(?P<tanggal>\d{2}/\d{2}/\d{4})\s+(?P<kelas>\d+)\s+(?P<merek>.+?)(?=\n\s*\d+\s+[A-Z0-9]+|$)',
             re.MULTILINE | re.DOTALL
         )
         
+        # Fused anchor untuk section detail: satu scan C-level untuk ketiga
+        # sentinel, dispatch via match.lastindex
+        self._detail_anchor_re = re.compile(
+            r'(?:Nomor Permohonan\s*:\s*(\w+))'
+            r'|(730 Nama Pemohon :)'
+            r'|(510 Uraian Barang/Jasa :)'
+        )
+        # Automaton Aho-Corasick untuk ketiga sentinel yang sama: satu pass
+        # linear DFA di C, lebih cepat dari alternation regex untuk literal
+        # fixed. None kalau pyahocorasick tidak terpasang (fallback ke regex).
+        if ahocorasick is not None:
+            self._detail_automaton = ahocorasick.Automaton()
+            for kind, word in enumerate(('Nomor Permohonan',
+                                         '730 Nama Pemohon :',
+                                         '510 Uraian Barang/Jasa :')):
+                self._detail_automaton.add_word(word, (kind, len(word)))
+            self._detail_automaton.make_automaton()
+        else:
+            self._detail_automaton = None
+        # Nilai nomor permohonan tepat setelah sentinel (anchored match)
+        self._nomor_value_re = re.compile(r'\s*:\s*(\w+)')
+        # Normalisasi whitespace nama merek (pre-compiled, dipanggil per entri)
+        self._ws_re = re.compile(r'\s+')
+        self._digit_line_re = re.compile(r'^\d+\s')
+        # Run kata ber-kapital untuk fallback metadata minimal
+        self._capitalized_run_re = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*')
+        # Baris tabel umum: ada pemisah spasi-ganda dalam satu baris
+        self._table_line_re = re.compile(r'^([^\n]*?  [^\n]+)$', re.MULTILINE)
+
+        # Cache hasil parse per-teks (slot tunggal berisi (teks, hasil)):
+        # debug_parse dan parse_trademarks_list memanggil ekstraksi yang sama
+        # pada string identik multi-MB, jadi scan regex kedua dieliminasi.
+        # Objek teksnya sendiri disimpan dan dibandingkan dengan `is` —
+        # id(teks) saja bisa teralias ke alamat bekas string lain setelah GC,
+        # dan hashing teks sebesar itu (lru_cache) mahal.
+        self._djki_cache = None  # type: Optional[tuple]
+        self._details_cache = None  # type: Optional[tuple]
+
         # Pattern untuk header DJKI
         self.djki_header_patterns = [
-            r'DIREKTORAT JENDERAL KEKAYAAN INTELEKTUAL',
-            r'DIREKTORAT MEREK DAN INDUKSI',
-            r'DAFTAR.*PERMOHONAN.*MEREK',
-            r'PENERIMAAN.*PUBLIKASI'
+            re.compile(pattern, re.IGNORECASE)
+            for pattern in [
+                r'DIREKTORAT JENDERAL KEKAYAAN INTELEKTUAL',
+                r'DIREKTORAT MEREK DAN INDUKSI',
+                r'DAFTAR.*PERMOHONAN.*MEREK',
+                r'PENERIMAAN.*PUBLIKASI'
+            ]
         ]
     
     def extract_text(self, file_path: Path) -> str:
-        """Extract text from PDF using pdfplumber"""
+        """Extract text from PDF using PyMuPDF"""
         try:
-            with pdfplumber.open(file_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text += page.extract_text() or ""
-                
-                if not text.strip():
-                    raise ValueError("No text could be extracted from PDF")
-                
-                logger.info(f"Successfully extracted {len(text)} characters from PDF")
-                return text
-                
+            doc = fitz.open(file_path)
+            try:
+                # Kumpulkan per halaman lalu join sekali; += per halaman menyalin
+                # ulang seluruh string setiap iterasi (kuadratik untuk PDF besar)
+                parts = []
+                for page in doc:
+                    page_text = page.get_text("text")
+                    if page_text:
+                        parts.append(page_text)
+                text = "".join(parts)
+            finally:
+                doc.close()
+
+            if not text.strip():
+                raise ValueError("No text could be extracted from PDF")
+
+            logger.info(f"Successfully extracted {len(text)} characters from PDF")
+            return text
+
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise
     
     def parse_metadata(self, text: str) -> TrademarkMetadata:
         """Parse trademark metadata from extracted text dengan multiple strategi"""
-        
-        # 1. Cek apakah ini format DJKI
-        if self._is_djki_format(text):
+
+        # 1. Cek format DJKI: ekstrak entri sekali (di-cache per teks), lalu
+        # deteksi dan parse memakai hasil yang sama — tanpa scan regex ulang
+        entries = self._extract_all_djki_entries(text)
+        if entries or any(p.search(text) for p in self.djki_header_patterns):
             logger.info("Detected DJKI format PDF")
-            djki_data = self._parse_djki_format_complete(text)
+            djki_data = self._parse_djki_from_entries(entries)
             if djki_data:
                 return djki_data
         
@@ -77,94 +157,75 @@ class PDFProcessor:
         """Cek apakah ini format DJKI berdasar header dan struktur"""
         # Cek header DJKI
         for pattern in self.djki_header_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
+            if pattern.search(text):
                 return True
-        
-        # Cek apakah ada data tabel DJKI
-        matches = self.djki_table_pattern.findall(text)
-        return len(matches) > 0
-    
-    def _parse_djki_format_complete(self, text: str) -> Optional[TrademarkMetadata]:
-        """Parse format DJKI dengan detail lengkap"""
-        logger.info("Parsing DJKI format...")
-        
-        # Cari semua entri dalam format tabel
-        matches = self.djki_table_pattern.findall(text)
-        
-        if not matches:
+
+        # Cek apakah ada data tabel DJKI (hasil extract di-cache per teks)
+        return bool(self._extract_all_djki_entries(text))
+
+    def _parse_djki_from_entries(self, entries: List[_DjkiEntry]) -> Optional[TrademarkMetadata]:
+        """Parse metadata DJKI dari entri yang sudah diekstrak (pure function,
+        tanpa scan teks ulang)"""
+        if not entries:
             logger.warning("No DJKI table data found")
             return None
-        
-        logger.info(f"Found {len(matches)} trademark entries in DJKI format")
-        
-        # Cari entri dengan kata "pinus" atau merek yang mengandung kata penting
-        target_entries = []
-        for match in matches:
-            no_urut, nomor_permohonan, tanggal, kelas, nama_merek = match
-            
-            # Bersihkan nama merek
-            nama_merek = nama_merek.strip()
-            
-            # Simpan semua entri untuk analisis
-            target_entries.append({
-                'no': no_urut,
-                'nomorPermohonan': nomor_permohonan,
-                'tanggal': tanggal,
-                'kelasBarangJasa': kelas,
-                'namaMerek': nama_merek
-            })
-            
-            logger.debug(f"Entry: {no_urut} | {nomor_permohonan} | {tanggal} | {kelas} | {nama_merek}")
-        
+
+        logger.info(f"Found {len(entries)} trademark entries in DJKI format")
+
         # Cari entri yang mengandung kata kunci
-        keyword_matches = [entry for entry in target_entries if 'pinus' in entry['namaMerek'].lower()]
-        
+        keyword_matches = [entry for entry in entries if 'pinus' in entry.nama_merek.lower()]
+
         if keyword_matches:
             selected_entry = keyword_matches[0]
-            logger.info(f"Selected keyword match: {selected_entry['namaMerek']}")
+            logger.info(f"Selected keyword match: {selected_entry.nama_merek}")
         else:
             # Ambil entri pertama sebagai fallback
-            selected_entry = target_entries[0]
-            logger.info(f"Selected first entry as fallback: {selected_entry['namaMerek']}")
-        
+            selected_entry = entries[0]
+            logger.info(f"Selected first entry as fallback: {selected_entry.nama_merek}")
+
         # Generate document ID
-        import uuid
-        doc_id = f"djki-{selected_entry['nomorPermohonan'].lower()}"
-        
+        doc_id = f"djki-{selected_entry.nomor.lower()}"
+
         # Buat deskripsi berdasarkan kelas
-        kelas_desc = self._get_class_description(selected_entry['kelasBarangJasa'])
-        
+        kelas_desc = self._get_class_description(selected_entry.kelas)
+
         return TrademarkMetadata(
             documentId=doc_id,
-            namaMerek=selected_entry['namaMerek'],
-            nomorPermohonan=selected_entry['nomorPermohonan'],
-            kelasBarangJasa=selected_entry['kelasBarangJasa'],
+            namaMerek=selected_entry.nama_merek,
+            nomorPermohonan=selected_entry.nomor,
+            kelasBarangJasa=selected_entry.kelas,
             namaPemohon="DJKI",  # Default untuk data DJKI
-            uraianBarangJasa=f"Kelas {selected_entry['kelasBarangJasa']}: {kelas_desc}. Total {len(target_entries)} merek dalam dokumen."
+            uraianBarangJasa=f"Kelas {selected_entry.kelas}: {kelas_desc}. Total {len(entries)} merek dalam dokumen."
         )
     
-    def _extract_all_djki_entries(self, text: str) -> List[Dict]:
+    def _extract_all_djki_entries(self, text: str) -> List[_DjkiEntry]:
         """Extract SEMUA entri DJKI sebagai list (tidak hanya satu)"""
-        table_matches = self.djki_table_pattern.findall(text)
-        
-        if not table_matches:
+        if self._djki_cache is not None and self._djki_cache[0] is text:
+            return self._djki_cache[1]
+
+        # finditer: iterasi lazy tanpa membangun list tuple findall
+        table_matches = self.djki_table_pattern.finditer(text)
+
+        first_match = next(table_matches, None)
+        if first_match is None:
+            self._djki_cache = (text, [])
             return []
-        
+
         # Extract data pemohon dan uraian dari section detail
         detail_data = self._extract_detail_sections(text)
         
         all_entries = []
-        for i, match in enumerate(table_matches):
+        for i, match in enumerate(itertools.chain([first_match], table_matches)):
             try:
-                # Setiap match adalah tuple dengan groups dari regex
-                no_urut = match[0].strip() if len(match) > 0 else str(i+1)
-                nomor_permohonan = match[1].strip() if len(match) > 1 else ""
-                tanggal = match[2].strip() if len(match) > 2 else ""
-                kelas = match[3].strip() if len(match) > 3 else ""
-                nama_merek = match[4].strip() if len(match) > 4 else ""
-                
+                # Named groups: akses langsung tanpa tuple intermediate
+                no_urut = match.group('no').strip()
+                nomor_permohonan = match.group('nomor').strip()
+                tanggal = match.group('tanggal').strip()
+                kelas = match.group('kelas').strip()
+                nama_merek = match.group('merek').strip()
+
                 # Bersihkan nama merek dari newlines dan multiple spaces
-                nama_merek = re.sub(r'\s+', ' ', nama_merek).strip()
+                nama_merek = self._ws_re.sub(' ', nama_merek).strip()
                 
                 if nama_merek:  # Hanya tambahkan jika ada nama merek
                     # Cari data detail untuk nomor permohonan ini
@@ -173,64 +234,109 @@ class PDFProcessor:
                     # Buat uraian dari kelas barang/jasa
                     uraian_barang_jasa = f"Kelas {kelas}" if kelas else ""
                     
-                    all_entries.append({
-                        'no': no_urut,
-                        'nomor': nomor_permohonan,
-                        'tanggal': tanggal,
-                        'kelas': kelas,
-                        'nama_merek': nama_merek,
-                        'pemohon': detail_info.get('pemohon', ''),
-                        'uraian': uraian_barang_jasa
-                    })
+                    all_entries.append(_DjkiEntry(
+                        no=no_urut,
+                        nomor=nomor_permohonan,
+                        tanggal=tanggal,
+                        kelas=kelas,
+                        nama_merek=nama_merek,
+                        pemohon=detail_info.get('pemohon', ''),
+                        uraian=uraian_barang_jasa
+                    ))
                     
             except Exception as e:
                 logger.warning(f"Error parsing entry {i}: {str(e)}")
                 continue
         
         logger.info(f"Extracted {len(all_entries)} DJKI entries from PDF")
+        self._djki_cache = (text, all_entries)
         return all_entries
     
+    def _iter_detail_anchors(self, text: str) -> Iterator[Tuple[int, int, Optional[str]]]:
+        """Yield (posisi, jenis, nilai_nomor) untuk setiap sentinel detail.
+
+        Jenis: 0 = Nomor Permohonan (nilai ikut di-yield), 1 = Nama Pemohon,
+        2 = Uraian Barang/Jasa. Pakai automaton Aho-Corasick bila tersedia
+        (satu scan linear untuk ketiga literal), fallback ke fused regex."""
+        if self._detail_automaton is not None:
+            for end_idx, (kind, word_len) in self._detail_automaton.iter(text):
+                start = end_idx - word_len + 1
+                if kind == 0:
+                    value_match = self._nomor_value_re.match(text, end_idx + 1)
+                    if value_match:
+                        yield start, 0, value_match.group(1)
+                else:
+                    yield start, kind, None
+        else:
+            for match in self._detail_anchor_re.finditer(text):
+                kind = match.lastindex - 1
+                yield match.start(), kind, match.group(1) if kind == 0 else None
+
     def _extract_detail_sections(self, text: str) -> Dict[str, Dict[str, str]]:
-        """Extract detail sections containing pemohon and uraian information"""
+        """Extract detail sections containing pemohon and uraian information.
+
+        Satu pass sentinel scan (lihat _iter_detail_anchors) menggantikan
+        iterasi per-baris Python; posisi baris dicari via bisect atas offset
+        awal baris."""
+        if self._details_cache is not None and self._details_cache[0] is text:
+            return self._details_cache[1]
+
         details = {}
-        lines = text.split('\n')
 
         current_nomor = None
         current_pemohon = None
         current_uraian = None
 
-        for i, line in enumerate(lines):
-            # Look for nomor permohonan pattern
-            nomor_match = re.search(r'Nomor Permohonan\s*:\s*(\w+)', line)
-            if nomor_match:
-                current_nomor = nomor_match.group(1)
+        # Offset awal setiap baris untuk lookup "baris berikutnya"
+        line_starts = [0]
+        line_starts.extend(m.end() for m in re.finditer(r'\n', text))
+        total_lines = len(line_starts)
 
-            # Look for pemohon pattern (730 Nama Pemohon :)
-            if '730 Nama Pemohon :' in line:
-                # Check if nama pemohon is on the same line after the colon
+        def line_at(index: int) -> Optional[str]:
+            if index < 0 or index >= total_lines:
+                return None
+            start = line_starts[index]
+            end = text.find('\n', start)
+            if end == -1:
+                end = len(text)
+            return text[start:end]
+
+        for pos, kind, value in self._iter_detail_anchors(text):
+            line_index = bisect.bisect_right(line_starts, pos) - 1
+
+            if kind == 0:
+                # Nomor Permohonan : XXX (nilai langsung dari scanner)
+                current_nomor = value
+
+            elif kind == 1:
+                # 730 Nama Pemohon : bisa di baris yang sama atau baris berikutnya
+                line = line_at(line_index)
                 pemohon_part = line.split('730 Nama Pemohon :', 1)[1].strip()
                 if pemohon_part:
                     current_pemohon = pemohon_part
                 else:
-                    # Nama pemohon is on the next line (if it's not "Alamat Pemohon")
-                    if i + 1 < len(lines):
-                        next_line = lines[i + 1].strip()
+                    next_line = line_at(line_index + 1)
+                    if next_line:
+                        next_line = next_line.strip()
                         if next_line and not next_line.startswith('Alamat Pemohon'):
                             current_pemohon = next_line
 
-            # Look for uraian barang/jasa pattern (510 Uraian Barang/Jasa :)
-            if '510 Uraian Barang/Jasa :' in line:
-                # Uraian could be on the same line after the colon or on next lines
+            else:
+                # 510 Uraian Barang/Jasa : bisa multi-baris (dengan marker ===)
+                line = line_at(line_index)
                 uraian_part = line.split('510 Uraian Barang/Jasa :', 1)[1].strip()
                 if uraian_part:
                     current_uraian = uraian_part
                 else:
-                    # Check next lines for uraian content (handle multi-line uraian with ===)
+                    # Check next lines for uraian content (up to 7 lines)
                     uraian_lines = []
-                    for j in range(i + 1, min(i + 8, len(lines))):  # Check up to 7 next lines
-                        next_line = lines[j].strip()
+                    for j in range(line_index + 1, min(line_index + 8, total_lines)):
+                        next_line = line_at(j)
+                        if next_line is None:
+                            break
+                        next_line = next_line.strip()
                         # Stop if we hit another section or empty line (but allow ===)
-                        if not next_line or (re.match(r'^\d+\s', next_line) and '===' not in next_line) or ('Nomor Permohonan' in next_line and '===' not in next_line):
+                        if not next_line or (self._digit_line_re.match(next_line) and '===' not in next_line) or ('Nomor Permohonan' in next_line and '===' not in next_line):
                             break
                         uraian_lines.append(next_line)
 
@@ -255,6 +361,7 @@ class PDFProcessor:
                 current_uraian = None
 
         logger.info(f"Found {len(details)} detail entries with pemohon/uraian data")
+        self._details_cache = (text, details)
         return details
     
     def _parse_label_format(self, text: str) -> Optional[TrademarkMetadata]:
@@ -262,7 +369,7 @@ class PDFProcessor:
         metadata = {}
         
         for field, pattern in self.metadata_patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
+            match = pattern.search(text)
             if match:
                 metadata[field] = match.group(1).strip()
             else:
@@ -273,43 +380,40 @@ class PDFProcessor:
             return None
         
         # Generate document ID
-        import uuid
         metadata['documentId'] = f"doc-{uuid.uuid4().hex[:8]}"
         
         return TrademarkMetadata(**metadata)
     
     def _parse_table_format(self, text: str) -> Optional[TrademarkMetadata]:
         """Parse format tabel umum (bukan DJKI)"""
-        # Coba cari baris yang mengandung data tabel dengan pemisah tab atau spasi ganda
-        lines = text.split('\n')
-        
-        for line in lines:
-            # Cari baris yang terlihat seperti data tabel (banyak spasi/tab)
-            if '  ' in line and len(line.split()) >= 3:
-                parts = line.strip().split()
-                if len(parts) >= 3:
-                    # Asumsikan: [nomor] [kode] [nama_merek]
-                    import uuid
-                    doc_id = f"table-{uuid.uuid4().hex[:8]}"
-                    
-                    return TrademarkMetadata(
-                        documentId=doc_id,
-                        namaMerek=" ".join(parts[2:]),  # Ambil bagian nama
-                        nomorPermohonan=parts[1] if len(parts) > 1 else "",
-                        kelasBarangJasa="",
-                        namaPemohon="",
-                        uraianBarangJasa=f"Extracted from table format: {line.strip()}"
-                    )
-        
+        # Kandidat baris tabel dicari via regex MULTILINE di C, tanpa
+        # text.split('\n') yang mematerialisasi N string per dokumen
+        for match in self._table_line_re.finditer(text):
+            line = match.group(1)
+            parts = line.strip().split()
+            if len(parts) >= 3:
+                # Asumsikan: [nomor] [kode] [nama_merek]
+                doc_id = f"table-{uuid.uuid4().hex[:8]}"
+
+                return TrademarkMetadata(
+                    documentId=doc_id,
+                    namaMerek=" ".join(parts[2:]),  # Ambil bagian nama
+                    nomorPermohonan=parts[1] if len(parts) > 1 else "",
+                    kelasBarangJasa="",
+                    namaPemohon="",
+                    uraianBarangJasa=f"Extracted from table format: {line.strip()}"
+                )
+
         return None
     
     def _create_minimal_metadata(self, text: str) -> TrademarkMetadata:
         """Buat metadata minimal untuk fallback terakhir"""
-        import uuid
-        
-        # Coba ekstrak kata yang mungkin adalah nama merek (kata yang di-capitalize)
-        words = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*', text)
-        potential_trademark = " ".join(words[:3]) if words else "Unknown Trademark"
+        # Coba ekstrak kata yang mungkin adalah nama merek (kata yang
+        # di-capitalize); islice berhenti setelah 3 match pertama, tidak
+        # perlu scan seluruh teks
+        words = [m.group(0)
+                 for m in itertools.islice(self._capitalized_run_re.finditer(text), 3)]
+        potential_trademark = " ".join(words) if words else "Unknown Trademark"
         
         doc_id = f"minimal-{uuid.uuid4().hex[:8]}"
         
@@ -333,25 +437,29 @@ class PDFProcessor:
         }
         return class_descriptions.get(class_num, f"Kelas {class_num}")
     
-    def parse_trademarks_list(self, text: str) -> List[IndividualTrademark]:
-        """Parse daftar merek individual dari teks PDF"""
-        from datetime import datetime
-        
+    def parse_trademarks_list(self, text: str,
+                              entries: Optional[List[_DjkiEntry]] = None) -> List[IndividualTrademark]:
+        """Parse daftar merek individual dari teks PDF.
+
+        Caller yang sudah memegang hasil _extract_all_djki_entries (mis.
+        debug_parse) bisa meneruskannya via `entries` agar tidak di-scan ulang."""
         # Ekstrak detail sections dulu untuk mapping pemohon dan uraian
         details = self._extract_detail_sections(text)
-        
+
         # Coba format DJKI dulu - ambil SEMUA entri
-        all_entries = self._extract_all_djki_entries(text)
+        all_entries = entries if entries is not None else self._extract_all_djki_entries(text)
         if all_entries:
+            # Satu timestamp untuk seluruh dokumen, bukan N syscall datetime.now()
+            upload_ts = datetime.now().isoformat()
             # Convert semua entri ke IndividualTrademark
             trademarks = []
             for i, entry in enumerate(all_entries):
                 # Generate unique ID untuk setiap merek - tambahkan index untuk menghindari duplicate
-                trademark_id = f"djki-{entry['nomor'].lower()}-{entry['kelas']}-{i}"
-                document_id = f"djki-{entry['nomor'].lower()}"  # Document ID untuk merek ini
+                trademark_id = f"djki-{entry.nomor.lower()}-{entry.kelas}-{i}"
+                document_id = f"djki-{entry.nomor.lower()}"  # Document ID untuk merek ini
                 
                 # Gunakan uraian detail dari mapping jika tersedia, fallback ke deskripsi kelas
-                nomor_permohonan = entry['nomor']
+                nomor_permohonan = entry.nomor
                 if nomor_permohonan in details and 'uraian' in details[nomor_permohonan]:
                     # Gunakan uraian detail yang sudah diekstrak
                     uraian = details[nomor_permohonan]['uraian']
@@ -362,24 +470,24 @@ class PDFProcessor:
                         uraian = uraian[:-3].strip()
                 else:
                     # Fallback ke deskripsi kelas generik
-                    kelas_desc = self._get_class_description(entry['kelas'])
-                    uraian = f"Kelas {entry['kelas']}: {kelas_desc}"
+                    kelas_desc = self._get_class_description(entry.kelas)
+                    uraian = f"Kelas {entry.kelas}: {kelas_desc}"
                 
                 # Gunakan pemohon dari mapping jika tersedia
-                nama_pemohon = entry['pemohon'] or "Tidak Diketahui"
+                nama_pemohon = entry.pemohon or "Tidak Diketahui"
                 if nomor_permohonan in details and 'pemohon' in details[nomor_permohonan]:
                     nama_pemohon = details[nomor_permohonan]['pemohon']
                 
                 trademarks.append(IndividualTrademark(
                     trademarkId=trademark_id,
-                    namaMerek=entry['nama_merek'],
-                    nomorPermohonan=entry['nomor'],
-                    kelasBarangJasa=entry['kelas'],
+                    namaMerek=entry.nama_merek,
+                    nomorPermohonan=entry.nomor,
+                    kelasBarangJasa=entry.kelas,
                     namaPemohon=nama_pemohon,
                     uraianBarangJasa=uraian,
                     documentId=document_id,
                     sourceDocument="pdf",
-                    uploadDate=datetime.now()
+                    uploadDate=upload_ts
                 ))
             
             logger.info(f"Successfully parsed {len(trademarks)} individual trademarks")
@@ -405,10 +513,11 @@ class PDFProcessor:
             result['total_entries_found'] = len(all_entries)
             
             if all_entries:
-                result['sample_raw_entries'] = all_entries[:3]  # Sample 3 entries
+                result['sample_raw_entries'] = [asdict(e) for e in all_entries[:3]]  # Sample 3 entries
             
-            # Coba parse sebagai daftar merek
-            trademarks_list = self.parse_trademarks_list(text)
+            # Coba parse sebagai daftar merek (entri DJKI di-pass agar
+            # tidak di-extract dua kali)
+            trademarks_list = self.parse_trademarks_list(text, entries=all_entries)
             result['trademarks_list_count'] = len(trademarks_list)
             
             # Ambil sample 5 merek pertama
@@ -448,4 +557,12 @@ class PDFProcessor:
         logger.info(f"Extracted {len(text)} characters from PDF")
         logger.info(f"Found {len(trademarks)} individual trademarks")
         
-        return text, trademarks
\ No newline at end of file
+        return text, trademarks
+def extract_trademarks_worker(file_path: str):
+    """Worker top-level untuk process pool ekstraksi (dipanggil via spawn).
+
+    Tinggal di modul ini supaya child hanya meng-import parser — bukan
+    main_service beserta singleton Pinecone/embedding-nya. Handle PDF tidak
+    picklable, jadi tiap worker membangun PDFProcessor sendiri."""
+    processor = PDFProcessor()
+    return processor.extract_trademarks_list(Path(file_path))
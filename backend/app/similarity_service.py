@@ -1,28 +1,222 @@
-import Levenshtein
+import os
+import threading
 import jellyfish
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import chain, repeat
+import numpy as np
+from rapidfuzz import process as rf_process
+from rapidfuzz.distance import JaroWinkler, Levenshtein
+from pathlib import Path
 from typing import List, Dict, Any
 from loguru import logger
+from pydantic import TypeAdapter
+from .config import settings
 from .models import SimilarityResult, SimilarityResponse
 
+# Validates a whole result list in one C-level pass instead of dispatching
+# the SimilarityResult constructor per row
+_RESULTS_ADAPTER = TypeAdapter(List[SimilarityResult])
+
+@lru_cache(maxsize=131072)
+def _norm(s: str) -> str:
+    """Cached lowercase/strip normalization for repeatedly-seen names"""
+    return s.lower().strip()
+
+@lru_cache(maxsize=131072)
+def _phonetic_codes(s: str) -> tuple:
+    """Cached (metaphone, soundex, nysiis) codes for one normalized name.
+
+    Candidate names recur across searches, so after warm-up each name costs
+    one dict hit instead of three jellyfish encodings."""
+    return (jellyfish.metaphone(s), jellyfish.soundex(s), jellyfish.nysiis(s))
+
+def _compute_features(name: str) -> tuple:
+    """(normalized text, phonetic codes) for one name.
+
+    Computed once per side of a comparison; scoring then only does
+    equality checks on the precomputed pieces."""
+    norm = _norm(name)
+    return (norm, _phonetic_codes(norm) if norm else ())
+
+def _score_against(target_feats: tuple, cand_feats: tuple) -> float:
+    """Phonetic score between two precomputed feature tuples"""
+    t_norm, t_codes = target_feats
+    c_norm, c_codes = cand_feats
+    if not t_norm or not c_norm:
+        return 0.0
+
+    # Cheap negative prefilter: soundex and nysiis keep the initial letter,
+    # so with different first letters and a >3 length gap the codes cannot
+    # all line up — skip the comparison entirely
+    if t_norm[0] != c_norm[0] and abs(len(t_norm) - len(c_norm)) > 3:
+        return 0.0
+
+    # Three equality checks per pair; the codes were encoded (or cache-hit)
+    # once per side in _compute_features
+    matches = sum(1 for c1, c2 in zip(t_codes, c_codes) if c1 == c2)
+
+    # Average phonetic similarity
+    return round(matches / len(t_codes) * 100, 1)
+
+def _phonetic_similarity(text1: str, text2: str) -> float:
+    """Phonetic similarity of two already-normalized strings.
+
+    Per-pair convenience over _score_against; batch callers precompute the
+    target features once instead. Module-level (not a method) so process-pool
+    workers can pickle the scoring path."""
+    return _score_against((text1, _phonetic_codes(text1) if text1 else ()),
+                          (text2, _phonetic_codes(text2) if text2 else ()))
+
+def _phonetic_shard(target_norm: str, names: List[str]) -> List[float]:
+    """Score one shard of candidate names against the target (pool worker)"""
+    target_feats = (target_norm, _phonetic_codes(target_norm) if target_norm else ())
+    return [_score_against(target_feats, _compute_features(name)) for name in names]
+
+# Candidate count above which phonetic scoring shards across processes;
+# below it, fork/pickle overhead exceeds the Python loop being saved
+_PARALLEL_THRESHOLD = 500
+_score_pool = None
+
+def _get_score_pool() -> ProcessPoolExecutor:
+    """Shared scoring pool, created on first large result set (not at import,
+    so small deployments never fork workers)"""
+    global _score_pool
+    if _score_pool is None:
+        _score_pool = ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+    return _score_pool
+
+try:
+    from numba import njit  # optional: JIT kernel for the LCS hot loop
+except ImportError:  # pragma: no cover - difflib path below covers it
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, boundscheck=False)
+    def _lcs_len(a, b, prev, cur):
+        """Longest common substring length over uint8 arrays.
+
+        Two rolling int32 rows (O(min-side) memory, no O(n*m) matrix); the
+        nested loop compiles to native code, no per-cell boxing. Row buffers
+        are passed in and reused across calls — only the used region is
+        zeroed, so the kernel allocates nothing."""
+        prev[:b.size + 1] = 0
+        cur[:b.size + 1] = 0
+        max_len = 0
+        for i in range(a.size):
+            for j in range(b.size):
+                if a[i] == b[j]:
+                    cur[j + 1] = prev[j] + 1
+                    if cur[j + 1] > max_len:
+                        max_len = cur[j + 1]
+                else:
+                    cur[j + 1] = 0
+            prev, cur = cur, prev
+        return max_len
+
+    # Shared scratch rows for the kernel, grown lazily on larger inputs.
+    # Mutated in place, so access goes through the lock below.
+    _lcs_scratch = np.zeros((2, 1024), dtype=np.int32)
+    _lcs_scratch_lock = threading.Lock()
+
+    # Warm-up call at import so the first real search doesn't pay JIT latency
+    _lcs_len(np.zeros(1, np.uint8), np.zeros(1, np.uint8),
+             _lcs_scratch[0], _lcs_scratch[1])
+else:
+    _lcs_len = None
+
 class SimilarityService:
     def __init__(self):
         self.phonetic_algorithms = ["metaphone", "soundex", "nysiis"]
+
+        # Local SoA embedding store: one contiguous float32 (N, dim) memmap,
+        # L2-normalized on append so reranking is a single matmul against it.
+        # ~8x smaller than the equivalent Python list-of-lists representation.
+        # Opt-in: populated only by explicit add_embeddings calls — the ingest
+        # pipeline does not mirror into it, since nothing consumes
+        # rerank_scores yet and the store has no deletion/dedup handling.
+        self._corpus_dir = Path(settings.upload_dir)
+        self._corpus_path = self._corpus_dir / "corpus.f32"
+        self._corpus_ids_path = self._corpus_dir / "corpus.ids"
+        self._dim = settings.embedding_dimension
+        self._corpus = None
+        self._corpus_ids: List[str] = []
+        self._load_corpus()
+
+    def _load_corpus(self):
+        """Map the persisted corpus back into memory if it exists"""
+        if not self._corpus_path.exists():
+            return
+
+        n_vectors = self._corpus_path.stat().st_size // (self._dim * 4)
+        if n_vectors == 0:
+            return
+
+        self._corpus = np.memmap(self._corpus_path, dtype=np.float32,
+                                 mode="r+", shape=(n_vectors, self._dim))
+        if self._corpus_ids_path.exists():
+            self._corpus_ids = self._corpus_ids_path.read_text().splitlines()
+
+        logger.info(f"Loaded embedding corpus: {n_vectors} vectors of dim {self._dim}")
+
+    def add_embeddings(self, ids: List[str], embeddings: List[List[float]]):
+        """Append vectors to the memmap-backed corpus (normalized, float32)"""
+        if len(ids) != len(embeddings):
+            raise ValueError("Number of ids must match number of embeddings")
+        if not ids:
+            return
+
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+        self._corpus_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._corpus_path, "ab") as f:
+            f.write(matrix.tobytes())
+        with open(self._corpus_ids_path, "a") as f:
+            f.write("\n".join(ids) + "\n")
+
+        self._corpus_ids.extend(ids)
+        n_vectors = self._corpus_path.stat().st_size // (self._dim * 4)
+        self._corpus = np.memmap(self._corpus_path, dtype=np.float32,
+                                 mode="r+", shape=(n_vectors, self._dim))
+
+        logger.info(f"Corpus extended to {n_vectors} vectors")
+
+    def rerank_scores(self, query_embedding) -> np.ndarray:
+        """Cosine scores of a query against the whole corpus in one SGEMV call"""
+        if self._corpus is None:
+            return np.empty(0, dtype=np.float32)
+
+        query = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # Corpus rows are pre-normalized, so the dot product is the cosine
+        return self._corpus @ query
     
-    def calculate_text_similarity(self, text1: str, text2: str) -> Dict[str, float]:
-        """Calculate various text similarity metrics"""
-        text1 = text1.lower().strip()
-        text2 = text2.lower().strip()
+    def calculate_text_similarity(self, text1: str, text2: str,
+                                  normalized: bool = False) -> Dict[str, float]:
+        """Calculate various text similarity metrics.
+
+        Pass normalized=True when both strings are already lowercased and
+        stripped, so one pair is not normalized once per metric family."""
+        if not normalized:
+            text1 = _norm(text1)
+            text2 = _norm(text2)
         
         if not text1 or not text2:
             return {"levenshtein": 0.0, "jaro_winkler": 0.0, "substring": 0.0}
         
-        # Levenshtein distance (normalized)
-        max_len = max(len(text1), len(text2))
-        levenshtein_dist = Levenshtein.distance(text1, text2)
-        levenshtein_sim = 1 - (levenshtein_dist / max_len) if max_len > 0 else 0.0
-        
+        # Levenshtein distance (normalized) — RapidFuzz's bit-parallel kernel
+        # handles the max-length normalization internally
+        levenshtein_sim = Levenshtein.normalized_similarity(text1, text2)
+
         # Jaro-Winkler similarity
-        jaro_winkler_sim = jellyfish.jaro_winkler_similarity(text1, text2)
+        jaro_winkler_sim = JaroWinkler.similarity(text1, text2)
         
         # Substring similarity
         substring_sim = self._calculate_substring_similarity(text1, text2)
@@ -41,65 +235,77 @@ class SimilarityService:
         if text1 in text2 or text2 in text1:
             return 1.0
         
-        # Calculate longest common substring
+        # Native kernel when numba is installed: LCS over UTF-8 bytes with
+        # rolling rows, normalized by byte length for consistency. The row
+        # buffers live at module scope and are reused under a lock instead of
+        # being reallocated per pair.
+        if _lcs_len is not None:
+            global _lcs_scratch
+            bytes1 = np.frombuffer(text1.encode(), dtype=np.uint8)
+            bytes2 = np.frombuffer(text2.encode(), dtype=np.uint8)
+            with _lcs_scratch_lock:
+                if _lcs_scratch.shape[1] < bytes2.size + 1:
+                    _lcs_scratch = np.zeros(
+                        (2, max(2 * _lcs_scratch.shape[1], bytes2.size + 1)),
+                        dtype=np.int32)
+                lcs = _lcs_len(bytes1, bytes2,
+                               _lcs_scratch[0], _lcs_scratch[1])
+            return int(lcs) / max(bytes1.size, bytes2.size)
+
+        # Longest common substring via difflib's matcher: hashes one string's
+        # positions once and skips non-matching regions, instead of filling an
+        # O(n*m) Python int matrix cell by cell. autojunk off so frequent
+        # characters in long uraian fields are not dropped.
         len1, len2 = len(text1), len(text2)
-        dp = [[0] * (len2 + 1) for _ in range(len1 + 1)]
-        max_length = 0
-        
-        for i in range(1, len1 + 1):
-            for j in range(1, len2 + 1):
-                if text1[i-1] == text2[j-1]:
-                    dp[i][j] = dp[i-1][j-1] + 1
-                    max_length = max(max_length, dp[i][j])
-        
-        return max_length / max(len1, len2)
+        match = SequenceMatcher(None, text1, text2,
+                                autojunk=False).find_longest_match(0, len1, 0, len2)
+
+        return match.size / max(len1, len2)
     
-    def calculate_phonetic_similarity(self, text1: str, text2: str) -> float:
+    def calculate_substring_scores(self, target: str, names: List[str]) -> List[float]:
+        """Substring similarity of one target against a batch of names.
+
+        The target is normalized once for the whole batch instead of per
+        pair. Containment keeps using str.__contains__ — CPython's two-way
+        search in C, which a single-needle Aho-Corasick automaton cannot
+        beat — and non-containment pairs fall through to the LCS kernel."""
+        target = _norm(target)
+        if not target:
+            return [0.0] * len(names)
+        return [self._calculate_substring_similarity(target, _norm(name))
+                for name in names]
+
+    def calculate_phonetic_similarity(self, text1: str, text2: str,
+                                      normalized: bool = False) -> float:
         """Calculate phonetic similarity using multiple algorithms"""
-        text1 = text1.lower().strip()
-        text2 = text2.lower().strip()
-        
-        if not text1 or not text2:
-            return 0.0
-        
-        phonetic_scores = []
-        
-        # Metaphone
-        metaphone1 = jellyfish.metaphone(text1)
-        metaphone2 = jellyfish.metaphone(text2)
-        metaphone_sim = 1.0 if metaphone1 == metaphone2 else 0.0
-        phonetic_scores.append(metaphone_sim)
-        
-        # Soundex
-        soundex1 = jellyfish.soundex(text1)
-        soundex2 = jellyfish.soundex(text2)
-        soundex_sim = 1.0 if soundex1 == soundex2 else 0.0
-        phonetic_scores.append(soundex_sim)
-        
-        # NYSIIS
-        nysiis1 = jellyfish.nysiis(text1)
-        nysiis2 = jellyfish.nysiis(text2)
-        nysiis_sim = 1.0 if nysiis1 == nysiis2 else 0.0
-        phonetic_scores.append(nysiis_sim)
-        
-        # Average phonetic similarity
-        return round(sum(phonetic_scores) / len(phonetic_scores) * 100, 1)
+        if not normalized:
+            text1 = _norm(text1)
+            text2 = _norm(text2)
+
+        return _phonetic_similarity(text1, text2)
     
     def calculate_overall_similarity(self, target_trademark: str, 
                                    candidate_metadata: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate overall similarity between target and candidate"""
         candidate_name = candidate_metadata.get("namaMerek", "")
-        
+
+        # Normalize once per pair; both metric families receive the already
+        # lowered/stripped strings
+        target_norm = _norm(target_trademark)
+        candidate_norm = _norm(candidate_name)
+
         # Text similarity
         text_similarity = self.calculate_text_similarity(
-            target_trademark, 
-            candidate_name
+            target_norm,
+            candidate_norm,
+            normalized=True
         )
-        
+
         # Phonetic similarity
         phonetic_similarity = self.calculate_phonetic_similarity(
-            target_trademark, 
-            candidate_name
+            target_norm,
+            candidate_norm,
+            normalized=True
         )
         
         # Overall score (weighted average)
@@ -125,35 +331,115 @@ class SimilarityService:
             "confidence_score": overall_score / 100.0  # Convert to decimal
         }
     
-    def process_search_results(self, target_trademark: str, 
+    def process_search_results(self, target_trademark: str,
                              pinecone_results: List[Dict[str, Any]],
-                             threshold: float = 0.15) -> SimilarityResponse:
+                             threshold: float = 0.15,
+                             top_k: int = 50) -> SimilarityResponse:
         """Process Pinecone results and calculate detailed similarities"""
-        
+
+        # Use more lenient filtering - allow lower scores if we have few
+        # results. Fields are pulled out of the nested metadata dicts once
+        # into parallel lists (SoA); downstream scoring and assembly index by
+        # position instead of re-dispatching dict.get per field per candidate.
+        lenient = len(pinecone_results) < 3
+        extracted = [
+            (str(metadata.get("namaMerek", "")),
+             metadata.get("nomorPermohonan", ""),
+             metadata.get("namaPemohon", ""),
+             metadata.get("kelasBarangJasa", ""),
+             metadata.get("uraianBarangJasa", ""),
+             metadata.get("status", "Active"))
+            for result in pinecone_results
+            if result.get("score", 0) >= threshold
+            or (lenient and result.get("score", 0) >= threshold * 0.5)
+            for metadata in (result["metadata"],)
+        ]
+        if extracted:
+            names, apps, owners, classes, descs, statuses = map(list, zip(*extracted))
+        else:
+            names = []
+
+        # One vectorized cdist call scores the target against every candidate
+        # name in C++ (bit-parallel kernels) instead of a per-pair Python loop.
+        # Only Jaro-Winkler feeds the final scores — the old per-pair path also
+        # computed Levenshtein and LCS similarities that were then discarded.
+        target_norm = target_trademark.lower().strip()
+        jw_scores = rf_process.cdist(
+            [target_norm],
+            [name.lower().strip() for name in names],
+            scorer=JaroWinkler.normalized_similarity,
+            workers=-1
+        )[0] if names else []
+
         filtered_results = []
-        for result in pinecone_results:
-            # Use more lenient filtering - allow lower scores if we have few results
-            result_score = result.get("score", 0)
-            if result_score >= threshold or (len(pinecone_results) < 3 and result_score >= threshold * 0.5):
-                try:
-                    similarity_data = self.calculate_overall_similarity(
-                        target_trademark, 
-                        result["metadata"]
-                    )
-                    filtered_results.append(similarity_data)
-                except Exception as e:
-                    logger.warning(f"Error calculating similarity for result: {e}")
-                    continue
-        
-        # Sort by overall score descending
-        filtered_results.sort(
-            key=lambda x: x["overall_similarity"], 
-            reverse=True
-        )
+        if names:
+            # Combine scores as vectors: one multiply-add over the whole batch
+            # instead of scalar arithmetic per candidate, then order once with
+            # argsort so no post-hoc dict sort is needed
+            jw_vec = np.round(np.asarray(jw_scores, dtype=np.float32) * 100, 1)
+            if len(names) > _PARALLEL_THRESHOLD:
+                # Scoring is embarrassingly parallel per candidate; shard the
+                # names across worker processes and flatten in input order
+                pool = _get_score_pool()
+                workers = pool._max_workers
+                shards = [list(shard) for shard in
+                          np.array_split(np.asarray(names, dtype=object), workers)]
+                phon_vec = np.fromiter(
+                    chain.from_iterable(
+                        pool.map(_phonetic_shard, repeat(target_norm), shards)
+                    ),
+                    dtype=np.float32, count=len(names)
+                )
+            else:
+                # Target-side normalization and codes are hoisted out of the
+                # loop; each candidate pays only its own feature lookup plus
+                # equality checks
+                target_feats = (target_norm,
+                                _phonetic_codes(target_norm) if target_norm else ())
+                phon_vec = np.fromiter(
+                    (_score_against(target_feats, _compute_features(name))
+                     for name in names),
+                    dtype=np.float32, count=len(names)
+                )
+            overall_vec = (jw_vec * 0.7 + phon_vec * 0.3) / 100.0
+            # argpartition pulls the unsorted top K out in O(n); only those K
+            # are then sorted, instead of fully ordering every candidate
+            k = min(top_k, overall_vec.size)
+            top = np.argpartition(-overall_vec, k - 1)[:k]
+            order = top[np.argsort(-overall_vec[top], kind="stable")]
+
+            # Dicts are materialized only here, already in descending order
+            for idx in order:
+                jw_pct = float(jw_vec[idx])
+                phonetic_similarity = float(phon_vec[idx])
+                overall_score = float(overall_vec[idx])
+                filtered_results.append({
+                    "trademark_name": names[idx],
+                    "application_number": apps[idx],
+                    "owner_name": owners[idx],
+                    "classification": classes[idx],
+                    "description": descs[idx],
+                    "status": statuses[idx],
+                    "overall_similarity": overall_score,
+                    "text_similarity": jw_pct / 100.0,
+                    "semantic_similarity": jw_pct / 100.0,  # Same as text for now
+                    "phonetic_similarity": phonetic_similarity / 100.0,
+                    "confidence_score": overall_score
+                })
         
+        # The dicts above are built in-process with known-good types, so
+        # model_construct skips pydantic validation per candidate; debug mode
+        # keeps full validation as a correctness net, done in a single
+        # adapter pass over the list rather than one constructor per row
+        if settings.debug:
+            results = _RESULTS_ADAPTER.validate_python(filtered_results)
+        else:
+            results = [SimilarityResult.model_construct(**result)
+                       for result in filtered_results]
+
         return SimilarityResponse(
             targetTrademark=target_trademark,
             totalCompared=len(pinecone_results),
             similarTrademarksFound=len(filtered_results),
-            results=[SimilarityResult(**result) for result in filtered_results]
+            results=results
         )
\ No newline at end of file
@@ -1,7 +1,29 @@
-from typing import List
+import re
+from typing import Iterator, List
 from loguru import logger
 from .models import TextChunk, TrademarkMetadata
 
+# Sentence boundary pattern, compiled once for all chunker instances
+_SENT_RE = re.compile(r'[.!?]+')
+
+# Prefix "Kelas X:" pada uraian barang/jasa, dibuang sebelum representasi
+_KELAS_PREFIX = re.compile(r'^Kelas\s+[^:]*:\s*')
+
+def _iter_sentences(text: str) -> Iterator[str]:
+    """Yield non-empty stripped sentences without materializing the full list.
+
+    finditer walks the boundary spans one at a time, so only the sentence
+    currently being accumulated exists as a Python string."""
+    prev = 0
+    for match in _SENT_RE.finditer(text):
+        sentence = text[prev:match.start()].strip()
+        prev = match.end()
+        if sentence:
+            yield sentence
+    tail = text[prev:].strip()
+    if tail:
+        yield tail
+
 class TextChunker:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
@@ -17,100 +39,102 @@ class TextChunker:
         text_length = len(text)
         start = 0
         chunk_index = 0
-        
+        # Each window advances by chunk_size - overlap so consecutive chunks
+        # share `chunk_overlap` characters (the old start/end bookkeeping made
+        # chunks chunk_size + overlap long instead)
+        step = self.chunk_size - self.chunk_overlap
+        if step <= 0:
+            step = self.chunk_size
+
         while start < text_length:
-            # Calculate end position
-            end = start + self.chunk_size
-            
-            # If this is not the first chunk, adjust for overlap
-            if chunk_index > 0:
-                start = max(0, start - self.chunk_overlap)
-            
-            # Extract chunk
-            chunk_text = text[start:end].strip()
-            
-            if chunk_text:
-                chunk = TextChunk(
-                    text=chunk_text,
+            end = min(start + self.chunk_size, text_length)
+
+            # Only (start, end) offsets are stored; the chunk text is sliced
+            # lazily on TextChunk.text access, so no per-chunk copies are
+            # retained here. isspace is a transient C scan to skip blanks.
+            if not text[start:end].isspace():
+                chunks.append(TextChunk(
+                    source=text,
+                    start=start,
+                    end=end,
                     chunk_index=chunk_index,
                     metadata=metadata
-                )
-                chunks.append(chunk)
+                ))
                 chunk_index += 1
-            
-            # Move start position for next chunk
-            start = end
-        
+
+            if end == text_length:
+                break
+            start += step
+
         logger.info(f"Created {len(chunks)} chunks from text of {text_length} characters")
         return chunks
     
     def smart_chunk_text(self, text: str, metadata: TrademarkMetadata) -> List[TextChunk]:
         """Intelligent chunking that tries to split on sentence boundaries with hard limits"""
-        import re
-        
-        # Split into sentences
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if s.strip()]
-        
         chunks = []
-        current_chunk = ""
+        # Kalimat diakumulasi sebagai list lalu di-join sekali per chunk;
+        # `current_chunk += " " + sentence` menyalin seluruh chunk setiap
+        # iterasi (kuadratik terhadap jumlah kalimat per chunk)
+        cur_parts: List[str] = []
+        cur_len = 0
         chunk_index = 0
-        
-        for sentence in sentences:
+
+        # Sentences are consumed lazily from the boundary scanner; no
+        # whole-document sentence list is built
+        for sentence in _iter_sentences(text):
             # Force split very long sentences
             if len(sentence) > self.chunk_size:
                 # Split long sentence into smaller parts
                 words = sentence.split()
-                temp_chunk = ""
-                
+                temp_parts: List[str] = []
+                temp_len = 0
+
                 for word in words:
-                    if len(temp_chunk) + len(word) + 1 > self.chunk_size and temp_chunk:
+                    if temp_len + len(word) + 1 > self.chunk_size and temp_parts:
                         # Save current part
-                        chunks.append(TextChunk(
-                            text=temp_chunk.strip(),
-                            chunk_index=chunk_index,
-                            metadata=metadata
-                        ))
+                        chunks.append(TextChunk.from_text(
+                            " ".join(temp_parts), chunk_index, metadata))
                         chunk_index += 1
-                        temp_chunk = word
+                        temp_parts = [word]
+                        temp_len = len(word)
                     else:
-                        if temp_chunk:
-                            temp_chunk += " " + word
-                        else:
-                            temp_chunk = word
-                
+                        temp_parts.append(word)
+                        temp_len += len(word) + 1 if temp_len else len(word)
+
                 # Add remaining part of long sentence
-                if temp_chunk.strip():
-                    current_chunk = temp_chunk.strip()
+                if temp_parts:
+                    cur_parts = [" ".join(temp_parts)]
+                    cur_len = len(cur_parts[0])
                 continue
-            
+
             # Normal processing for regular sentences
-            if len(current_chunk) + len(sentence) + 1 > self.chunk_size and current_chunk:
-                # Save current chunk
-                chunks.append(TextChunk(
-                    text=current_chunk.strip(),
-                    chunk_index=chunk_index,
-                    metadata=metadata
-                ))
+            if cur_len + len(sentence) + 1 > self.chunk_size and cur_parts:
+                # Save current chunk (single join allocation)
+                chunk_text = " ".join(cur_parts)
+                chunks.append(TextChunk.from_text(
+                    chunk_text.strip(), chunk_index, metadata))
                 chunk_index += 1
-                
+
                 # Start new chunk with overlap
-                overlap_size = min(self.chunk_overlap, len(current_chunk))
-                current_chunk = current_chunk[-overlap_size:] + " " + sentence
+                overlap_size = min(self.chunk_overlap, len(chunk_text))
+                tail = chunk_text[-overlap_size:]
+                cur_parts = [tail, sentence]
+                cur_len = len(tail) + 1 + len(sentence)
             else:
                 # Add to current chunk
-                if current_chunk:
-                    current_chunk += " " + sentence
+                if cur_parts:
+                    cur_parts.append(sentence)
+                    cur_len += len(sentence) + 1
                 else:
-                    current_chunk = sentence
-        
+                    cur_parts = [sentence]
+                    cur_len = len(sentence)
+
         # Add remaining text as final chunk
-        if current_chunk.strip():
-            chunks.append(TextChunk(
-                text=current_chunk.strip(),
-                chunk_index=chunk_index,
-                metadata=metadata
-            ))
+        if cur_parts:
+            final_text = " ".join(cur_parts).strip()
+            if final_text:
+                chunks.append(TextChunk.from_text(
+                    final_text, chunk_index, metadata))
         
         logger.info(f"Smart chunking created {len(chunks)} chunks")
         return chunks
@@ -120,30 +144,19 @@ class TextChunker:
         Create optimal text representation for single-vector-per-trademark strategy.
         Combines all relevant information into a comprehensive text for embedding.
         """
-        parts = []
-        
-        # Nama merek - prioritas utama
-        if hasattr(trademark_data, 'namaMerek') and trademark_data.namaMerek:
-            parts.append(f"Nama Merek: {trademark_data.namaMerek}")
-        
-        # Nama pemohon - penting untuk konteks bisnis
-        if hasattr(trademark_data, 'namaPemohon') and trademark_data.namaPemohon:
-            parts.append(f"Pemohon: {trademark_data.namaPemohon}")
-        
-        # Uraian barang/jasa - detail utama
-        if hasattr(trademark_data, 'uraianBarangJasa') and trademark_data.uraianBarangJasa:
+        td = trademark_data
+        # Akses atribut langsung (model selalu punya field ini); hasattr +
+        # getattr per field hanya menambah overhead dispatch di loop ingest
+        fields = {
+            "Nama Merek": td.namaMerek,
+            "Pemohon": td.namaPemohon,
             # Bersihkan uraian dari prefix "Kelas X:" jika ada
-            uraian = trademark_data.uraianBarangJasa
-            if uraian.startswith("Kelas "):
-                uraian = uraian.split(":", 1)[-1].strip()
-            parts.append(f"Barang/Jasa: {uraian}")
-        
-        # Kelas barang/jasa - kategori
-        if hasattr(trademark_data, 'kelasBarangJasa') and trademark_data.kelasBarangJasa:
-            parts.append(f"Kelas: {trademark_data.kelasBarangJasa}")
-        
-        # Gabungkan semua bagian
-        combined_text = " | ".join(parts)
-        
+            "Barang/Jasa": _KELAS_PREFIX.sub('', td.uraianBarangJasa or ''),
+            "Kelas": td.kelasBarangJasa,
+        }
+        combined_text = " | ".join(
+            f"{label}: {value}" for label, value in fields.items() if value
+        )
+
         logger.info(f"Created trademark representation: {len(combined_text)} characters")
         return combined_text
\ No newline at end of file
@@ -1,11 +1,19 @@
+import os
+
 import uvicorn
 from app.config import settings
 
 if __name__ == "__main__":
+    # Production run: uvloop event loop + httptools HTTP parser (both C
+    # implementations) and one worker per core. Debug keeps the defaults so
+    # reload works (reload is incompatible with multiple workers).
     uvicorn.run(
         "app.api:app",
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        log_level="info"
-    )
\ No newline at end of file
+        log_level="info",
+        loop="auto" if settings.debug else "uvloop",
+        http="httptools",
+        workers=1 if settings.debug else (os.cpu_count() or 1)
+    )